@@ -1,53 +1,526 @@
 
+import collections
+import functools
+import hashlib
+import json
+import mmap
 import os
+import re
+import subprocess
 import sys
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+G_SOURCE_DIR = "src/shaders"
+G_OUTPUT_DIR = "out/shaders"
+G_SHADER_TYPES = [ "vert", "geom", "frag" ]
+G_CHECKSUM_FILE = "checksum.json"
+# Bump this to invalidate every stored checksum at once (e.g. when the hash function
+# or the entry layout changes)
+G_CHECKSUM_VERSION = 2
+
+# The project root sits two directories above this script (utils/python)
+G_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0]))))
+G_SOURCE_PATH = os.path.normpath(f"{G_PROJECT_DIR}/{G_SOURCE_DIR}")
+G_OUTPUT_PATH = os.path.normpath(f"{G_PROJECT_DIR}/{G_OUTPUT_DIR}")
+G_INCLUDE_PATH = G_SOURCE_PATH
+
+# Compile the parsing patterns once at import time instead of re-building them (and
+# hitting re's internal pattern cache) on every call
+G_COMMENT_REGEX = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+G_STRUCT_REGEX = re.compile(r"\{(.*?)\}\s*(.*?)$", re.DOTALL)
+G_MEMBER_REGEX = re.compile(r"\s*(.*?)\s+(.*?);", re.DOTALL)
+G_INCLUDE_REGEX = re.compile(r'#include\s+"(.*?)"')
+
+# Maps a source file to the list of files it directly #includes, so shared includes
+# are only ever opened and scanned once per build rather than once per shader
+G_DIRECT_DEPS_CACHE = {}
+
+# Output directories we already created (or confirmed exist) this build, so repeated
+# shaders in the same folder don't re-issue the os.makedirs syscall chain
+G_CREATED_DIRS = set()
+
+ShaderOutput = collections.namedtuple("ShaderOutput", [ "path", "name" ])
+
+G_VULKAN_SDK = os.environ.get("VULKAN_SDK")
+G_SHADER_COMPILER = os.path.normpath(f"{G_VULKAN_SDK}/Bin/glslc.exe") if G_VULKAN_SDK else None
+
+@functools.lru_cache(maxsize=None)
+def ConvertToRelativePath(path):
+    # Strip the project directory from the given path so we don't log (or store) absolute
+    # paths. os.path.relpath is safer than substring-replacing the project directory out
+    # of the path (which could match elsewhere in it), and the result is cached since the
+    # same source and dependency paths come up over and over in the hot loop
+    return os.path.normpath(f"TANG/{os.path.relpath(path, G_PROJECT_DIR)}")
+
+def HashFile(path):
+    # We only need change detection here, not cryptographic strength, so BLAKE2b with a
+    # 64-bit digest beats hashing with SHA-256 and throwing most of the digest away.
+    # The file is memory-mapped into the hasher rather than read into an intermediate
+    # bytes object, which keeps peak memory flat no matter how large the source is
+    hasher = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as fileHandle:
+        # mmap raises on zero-byte files, and there's nothing to hash anyway
+        if os.fstat(fileHandle.fileno()).st_size > 0:
+            with mmap.mmap(fileHandle.fileno(), 0, access=mmap.ACCESS_READ) as mappedFile:
+                hasher.update(mappedFile)
+    return hasher.hexdigest()
+
+def GetStoredHash(checksumEntry):
+    # Checksum entries are stored as { "h": hash, "m": mtime_ns, "s": size }. Older
+    # checksum files stored the bare hash string, so fall back to that
+    if isinstance(checksumEntry, dict):
+        return checksumEntry.get("h")
+    return checksumEntry
+
+def ComputeChecksumEntry(path, storedEntry):
+    # Returns an up-to-date checksum entry for the given file. When the file's mtime and
+    # size both match the stored entry we reuse the stored hash, skipping the read and
+    # hash pass entirely on unchanged files
+    fileStats = os.stat(path)
+    if isinstance(storedEntry, dict) and storedEntry.get("m") == fileStats.st_mtime_ns and storedEntry.get("s") == fileStats.st_size:
+        return storedEntry
+
+    return { "h": HashFile(path), "m": fileStats.st_mtime_ns, "s": fileStats.st_size }
+
+def TryComputeChecksumEntry(path, storedEntry):
+    # Like ComputeChecksumEntry, but returns None when the file doesn't exist. A file
+    # in the dependency graph can vanish out from under us (e.g. a deleted include
+    # that shaders still reference); that's a change for its dependents to react to,
+    # not a reason to abort the whole build with a traceback
+    try:
+        return ComputeChecksumEntry(path, storedEntry)
+    except OSError:
+        return None
+
+def CompileShaderByteCode(shaderPath, shaderOutputPath):
+    # Invoke glslc directly rather than through os.system, which spawns an extra shell
+    # per shader and re-parses all the quoting. Returns the CompletedProcess so callers
+    # can check the return code and log glslc's output without interleaving
+    compilerArgs = [ G_SHADER_COMPILER, shaderPath, "-O", "-I", G_INCLUDE_PATH, "-o", shaderOutputPath ]
+    creationFlags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+    return subprocess.run(compilerArgs, check=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, creationflags=creationFlags)
+
+def GetDirectDependencies(sourcePath, storedEntry=None):
+    # Returns the absolute paths of the files directly #included by the given source
+    # file. The result is memoized in G_DIRECT_DEPS_CACHE so every file is read and
+    # scanned at most once per build, no matter how many shaders include it
+    if sourcePath in G_DIRECT_DEPS_CACHE:
+        return G_DIRECT_DEPS_CACHE[sourcePath]
+
+    # When the stored checksum entry recorded a dependency list and the file's stat
+    # still matches it, trust the list: an unchanged file then costs one stat call
+    # instead of being opened and scanned for #includes every single run
+    if isinstance(storedEntry, dict) and "d" in storedEntry:
+        try:
+            fileStats = os.stat(sourcePath)
+            if storedEntry.get("m") == fileStats.st_mtime_ns and storedEntry.get("s") == fileStats.st_size:
+                # Recorded dependencies stay in the graph even if they were deleted in
+                # the meantime; the hash pass treats a missing file as dirty, which is
+                # what forces the dependents to rebuild and surface the glslc error
+                directDependencies = [ os.path.normpath(f"{G_PROJECT_DIR}/{dependency}") for dependency in storedEntry["d"] ]
+                G_DIRECT_DEPS_CACHE[sourcePath] = directDependencies
+                return directDependencies
+        except OSError:
+            pass
+
+    directDependencies = []
+    try:
+        with open(sourcePath, "r") as sourceFile:
+            source = sourceFile.read()
+    except OSError:
+        G_DIRECT_DEPS_CACHE[sourcePath] = directDependencies
+        return directDependencies
+
+    # Scan with comments stripped, so a commented-out #include (valid GLSL that glslc
+    # happily compiles) doesn't end up in the dependency graph
+    sourceDir = os.path.dirname(sourcePath)
+    for match in G_INCLUDE_REGEX.finditer(StripComments(source)):
+        # Includes are resolved relative to the including file first, then the
+        # global include path (mirroring how glslc resolves them with -I)
+        includePath = os.path.normpath(f"{sourceDir}/{match.group(1)}")
+        if not os.path.isfile(includePath):
+            includePath = os.path.normpath(f"{G_INCLUDE_PATH}/{match.group(1)}")
+        if not os.path.isfile(includePath):
+            # Warn, but keep the unresolved path in the graph: the hash pass flags
+            # missing files as dirty, so every dependent shader is recompiled and
+            # glslc reports a proper error for exactly the shaders affected
+            print(f'[SHADER] Warning: could not resolve #include "{match.group(1)}" in "{ConvertToRelativePath(sourcePath)}"')
+        directDependencies.append(includePath)
+
+    G_DIRECT_DEPS_CACHE[sourcePath] = directDependencies
+    return directDependencies
+
+def ComputeDependencies(shaderPath):
+    # Walks the include graph breadth-first and returns every file the shader
+    # transitively depends on
+    dependencies = []
+    visited = { shaderPath }
+    pendingFiles = [ shaderPath ]
+    while pendingFiles:
+        currentFile = pendingFiles.pop(0)
+        for dependency in GetDirectDependencies(currentFile):
+            if dependency not in visited:
+                visited.add(dependency)
+                dependencies.append(dependency)
+                pendingFiles.append(dependency)
+    return dependencies
+
+def ParseLayoutQualifiers(layoutQualifiers):
+    # Converts the contents of a layout(...) declaration such as "set = 0, binding = 1"
+    # into a dictionary such as { "set": 0, "binding": 1 }
+    # str.partition walks each qualifier once and always returns a 3-tuple, so there's
+    # no whitespace-strip-and-rejoin pass over the whole string and no intermediate
+    # lists like the old join/split/split chain produced
+    qualifiers = {}
+    for qualifier in layoutQualifiers.split(','):
+        (name, separator, value) = qualifier.partition('=')
+        name = name.strip()
+        if not name:
+            continue
+        if separator:
+            value = value.strip()
+            qualifiers[name] = int(value) if value.isdigit() else value
+        else:
+            qualifiers[name] = None
+    return qualifiers
+
+def ParseLayoutDeclaration(layoutDeclaration):
+    # Splits a declaration such as "uniform sampler2D diffuseSampler" into its
+    # storage qualifier(s), type and (optional) name
+    tokens = layoutDeclaration.split()
+    declaration = {}
+    if len(tokens) == 1:
+        declaration["storage"] = tokens[0]
+    elif len(tokens) == 2:
+        # Uniform blocks only declare storage + type here; the instance name (if any)
+        # comes after the struct body
+        declaration["storage"] = tokens[0]
+        declaration["type"] = tokens[1]
+    elif len(tokens) >= 3:
+        declaration["storage"] = ' '.join(tokens[:-2])
+        declaration["type"] = tokens[-2]
+        declaration["name"] = tokens[-1]
+    return declaration
+
+def ParseLayoutUniformStruct(structString):
+    # Parses the "{ <members> } <instanceName>" chunk of a uniform block declaration.
+    # Returns a list of the struct's members plus the instance name, if one was given
+    match = G_STRUCT_REGEX.match(structString)
+    if match is None:
+        return ([], "")
+    members = []
+    for memberMatch in G_MEMBER_REGEX.finditer(match.group(1)):
+        members.append({ "type": memberMatch.group(1).strip(), "name": memberMatch.group(2).strip() })
+    return (members, match.group(2).strip())
+
+def StripComments(shaderSource):
+    # Blank out // line comments and /* */ block comments before scanning for layouts,
+    # so stray semicolons or braces inside them can't throw the scanner off
+    return G_COMMENT_REGEX.sub(' ', shaderSource)
+
+def IterateLayoutBlocks(shaderSource):
+    # Linear scan over the source yielding one (qualifiers, declaration, structString)
+    # tuple per layout(...) declaration. The old DOTALL regex had nested lazy groups,
+    # which makes re's backtracking engine degenerate on large or malformed sources;
+    # walking the string by hand is deterministic and strictly O(n)
+    sourceLength = len(shaderSource)
+    searchIndex = 0
+    while True:
+        layoutIndex = shaderSource.find("layout", searchIndex)
+        if layoutIndex == -1:
+            return
+        searchIndex = layoutIndex + len("layout")
+
+        # The keyword must be followed (allowing whitespace) by the qualifier list
+        openParenIndex = searchIndex
+        while openParenIndex < sourceLength and shaderSource[openParenIndex].isspace():
+            openParenIndex += 1
+        if openParenIndex >= sourceLength or shaderSource[openParenIndex] != '(':
+            continue
+
+        # Walk to the balanced closing parenthesis
+        currentIndex = openParenIndex + 1
+        parenDepth = 1
+        while currentIndex < sourceLength and parenDepth > 0:
+            if shaderSource[currentIndex] == '(':
+                parenDepth += 1
+            elif shaderSource[currentIndex] == ')':
+                parenDepth -= 1
+            currentIndex += 1
+        if parenDepth > 0:
+            return
+        qualifiers = shaderSource[(openParenIndex + 1):(currentIndex - 1)]
+
+        # The declaration runs until the terminating ';', or until a '{' when the layout
+        # declares a uniform block
+        declarationEnd = currentIndex
+        while declarationEnd < sourceLength and shaderSource[declarationEnd] not in ";{":
+            declarationEnd += 1
+        if declarationEnd >= sourceLength:
+            return
+        declaration = shaderSource[currentIndex:declarationEnd]
+
+        structString = None
+        if shaderSource[declarationEnd] == '{':
+            # Walk the balanced struct body, then on to the ';' past the instance name
+            currentIndex = declarationEnd + 1
+            braceDepth = 1
+            while currentIndex < sourceLength and braceDepth > 0:
+                if shaderSource[currentIndex] == '{':
+                    braceDepth += 1
+                elif shaderSource[currentIndex] == '}':
+                    braceDepth -= 1
+                currentIndex += 1
+            semicolonIndex = shaderSource.find(';', currentIndex)
+            if braceDepth > 0 or semicolonIndex == -1:
+                return
+            structString = shaderSource[declarationEnd:semicolonIndex]
+            searchIndex = semicolonIndex + 1
+        else:
+            searchIndex = declarationEnd + 1
+
+        yield (qualifiers, declaration, structString)
+
+def GenerateShaderMetadata(shaderPath, outputPath, shaderName):
+    # Scans the shader source for layout(...) declarations and dumps everything we find
+    # into a .meta file next to the compiled byte code. The idea is that the hand-written
+    # *_data.h tables in src/shaders can eventually be generated from these instead
+    with open(shaderPath, "r") as shaderFile:
+        shaderSource = shaderFile.read()
+
+    metadata = []
+    for (qualifiers, declaration, structString) in IterateLayoutBlocks(StripComments(shaderSource)):
+        entry = { "qualifiers": ParseLayoutQualifiers(qualifiers) }
+        entry.update(ParseLayoutDeclaration(declaration))
+        if structString is not None:
+            (members, instanceName) = ParseLayoutUniformStruct(structString)
+            entry["members"] = members
+            if instanceName:
+                entry["name"] = instanceName
+        metadata.append(entry)
+
+    with open(f"{outputPath}/{shaderName}.meta", "w") as metaFile:
+        json.dump(metadata, metaFile, indent=2)
+
+def EnsureOutputDirExists(outputPath):
+    if outputPath not in G_CREATED_DIRS:
+        os.makedirs(outputPath, exist_ok=True)
+        G_CREATED_DIRS.add(outputPath)
+
+def GetShaderOutputPathFromSourcePath(shaderPath):
+    shaderName = os.path.splitext(shaderPath)[1][1:]
+    parentDirName = os.path.basename(os.path.dirname(shaderPath))
+    return ShaderOutput(os.path.normpath(f"{G_OUTPUT_PATH}/{parentDirName}"), shaderName)
+
+def CompileShader(workItem):
+    # Runs on a worker process. Regenerates the shader's metadata and, if the checksum
+    # gate decided the shader changed, re-compiles its byte code
+    (shaderPath, shortShaderSrcPath, needsCompile, needsMetadata) = workItem
+    shaderOutput = GetShaderOutputPathFromSourcePath(shaderPath)
+    metaFilePath = f"{shaderOutput.path}/{shaderOutput.name}.meta"
+
+    EnsureOutputDirExists(shaderOutput.path)
+
+    # The metadata is a pure function of the shader source, so it's only regenerated
+    # when the gate saw the source (or the .meta file itself) change
+    newMetaEntry = None
+    if needsMetadata:
+        GenerateShaderMetadata(shaderPath, shaderOutput.path, shaderOutput.name)
+        newMetaEntry = ComputeChecksumEntry(metaFilePath, None)
+
+    # Log lines are buffered and returned to the main process rather than printed here;
+    # every print acquires the stdout lock and flushes, which serializes the workers
+    # and interleaves their output
+    logMessages = []
+    compileSucceeded = True
+    if needsCompile:
+        fullShaderDstPath = f"{shaderOutput.path}/{shaderOutput.name}"
+        compilerResult = CompileShaderByteCode(shaderPath, f"{fullShaderDstPath}.spv")
+        compileSucceeded = (compilerResult.returncode == 0)
+        if compileSucceeded:
+            logMessages.append(f'[SHADER] Compiled "{shortShaderSrcPath}" into "{ConvertToRelativePath(fullShaderDstPath)}.spv"')
+        else:
+            logMessages.append(f'[SHADER] Failed to compile "{shortShaderSrcPath}"!\n{compilerResult.stdout.decode(errors="replace")}')
+    else:
+        logMessages.append(f'[SHADER] Updated metadata for "{shortShaderSrcPath}"')
+
+    return (shortShaderSrcPath, compileSucceeded, ConvertToRelativePath(metaFilePath), newMetaEntry, logMessages)
 
 def main():
-    vulkanSDK = os.environ["VULKAN_SDK"]
-    sourceDir = "src/shaders"
-    outputDir = "out/shaders"
-    shaderTypes = [ "vert", "geom", "frag" ]
-    projectDir = str(Path(sys.argv[0]).parent.absolute().parent.parent) # This is ugly, but for some reason it won't let me do .parent 3 times...
-    
     # Ensure the Vulkan SDK is installed
-    if vulkanSDK is None:
+    if G_VULKAN_SDK is None:
         print("Please install the Vulkan SDK to compile shaders")
         return
-        
+
     print("Building shaders start...")
-    
-    shaderCompiler = os.path.normpath(f"{vulkanSDK}/Bin/glslc.exe")
-    print(f"Compiling shaders using '{shaderCompiler}'")
-    
+    print(f"Compiling shaders using '{G_SHADER_COMPILER}'")
+
     # Check that the output directory exists
-    os.makedirs(f"{projectDir}/{outputDir}", exist_ok=True)
-    
-    # Get list of source shaders to compile
+    os.makedirs(G_OUTPUT_PATH, exist_ok=True)
+
+    # Get list of source shaders to compile. A single walk that filters on extension
+    # beats one full rglob traversal (plus stat calls) per shader type
+    shaderExtensions = { f".{shaderType}" for shaderType in G_SHADER_TYPES }
     shaderList = []
-    for shaderType in shaderTypes:
-        for path in Path(f"{projectDir}/{sourceDir}").rglob(f"*.{shaderType}"):
-            shaderList.append(path)
-    
-    # TODO - Checksum shader sources and only compile those which are different from the ones
-    #        we already compiled
-    
-    # Compile the shader sources
+    for (root, _, files) in os.walk(G_SOURCE_PATH):
+        for fileName in files:
+            if os.path.splitext(fileName)[1] in shaderExtensions:
+                shaderList.append(os.path.normpath(os.path.join(root, fileName)))
+
+    # Checksum the shader sources and only compile those which are different from the ones
+    # we already compiled
+    checksumFilePath = f"{G_OUTPUT_PATH}/{G_CHECKSUM_FILE}"
+    checksums = {}
+    try:
+        with open(checksumFilePath, "r") as checksumFile:
+            storedChecksums = json.load(checksumFile)
+        # Checksums from a different version were produced by a different hash function
+        # or entry layout, so everything simply gets rebuilt once
+        if isinstance(storedChecksums, dict) and storedChecksums.get("version") == G_CHECKSUM_VERSION:
+            checksums = storedChecksums.get("files", {})
+    except (OSError, ValueError):
+        # A missing or corrupt checksum file just means a full rebuild; attempting the
+        # open directly also avoids racing an exists() check against the filesystem.
+        # ValueError covers both JSONDecodeError (malformed JSON) and UnicodeDecodeError
+        # (the file isn't even valid UTF-8)
+        pass
+
+    # Resolve the include graph once up front. The direct-deps cache guarantees every
+    # reachable file is opened and scanned a single time, after which we know the full
+    # set of files this build depends on
+    allFiles = set(shaderList)
+    pendingFiles = list(shaderList)
+    while pendingFiles:
+        currentFile = pendingFiles.pop()
+        for dependency in GetDirectDependencies(currentFile, checksums.get(ConvertToRelativePath(currentFile))):
+            if dependency not in allFiles:
+                allFiles.add(dependency)
+                pendingFiles.append(dependency)
+
+    # Hash every file (shader or include) exactly once and diff against the stored
+    # checksums to find what actually changed. On a cold build this pass is dominated by
+    # file-open latency, and hashlib releases the GIL while digesting, so spreading it
+    # over a thread pool overlaps the I/O and the hashing across files
+    fileList = sorted(allFiles)
+    with ThreadPoolExecutor() as hashExecutor:
+        checksumEntries = list(hashExecutor.map(lambda filePath: TryComputeChecksumEntry(filePath, checksums.get(ConvertToRelativePath(filePath))), fileList))
+
+    newHashes = {}
+    dirtyFiles = set()
+    for (filePath, newEntry) in zip(fileList, checksumEntries):
+        shortFilePath = ConvertToRelativePath(filePath)
+
+        # A file that no longer exists counts as changed: its dependents must rebuild
+        # (letting glslc report the missing include), and its stale entry is dropped
+        if newEntry is None:
+            dirtyFiles.add(filePath)
+            checksums.pop(shortFilePath, None)
+            continue
+
+        # Freshly-hashed entries also record the file's direct include list (relative to
+        # the project root) so the next run can rebuild the graph from stat calls alone
+        if "d" not in newEntry:
+            newEntry["d"] = [ os.path.relpath(dependency, G_PROJECT_DIR) for dependency in GetDirectDependencies(filePath) ]
+        newHashes[shortFilePath] = newEntry
+        if GetStoredHash(checksums.get(shortFilePath)) != newEntry["h"]:
+            dirtyFiles.add(filePath)
+
+    # Invert the include graph and propagate dirtiness through it. The question we
+    # actually need answered is "which shaders are affected when file X changes", which
+    # runs opposite to the direction the #includes point in
+    dependentFiles = {}
+    for (sourceFile, directDependencies) in G_DIRECT_DEPS_CACHE.items():
+        for dependency in directDependencies:
+            dependentFiles.setdefault(dependency, []).append(sourceFile)
+
+    affectedFiles = set(dirtyFiles)
+    pendingFiles = list(dirtyFiles)
+    while pendingFiles:
+        currentFile = pendingFiles.pop()
+        for dependentFile in dependentFiles.get(currentFile, []):
+            if dependentFile not in affectedFiles:
+                affectedFiles.add(dependentFile)
+                pendingFiles.append(dependentFile)
+
+    workList = []
     for shaderPath in shaderList:
-        shaderName = (shaderPath.suffix)[1:]
-        parentDirName = shaderPath.parent.name
-        fullOutputPath = os.path.normpath(f"{projectDir}/{outputDir}/{parentDirName}")
-        
-        os.makedirs(fullOutputPath, exist_ok=True)
-        os.system(f'{shaderCompiler} "{shaderPath}" -o "{fullOutputPath}/{shaderName}.spv"')
-        
-        # Log the source and output paths to the console
-        fullShaderDstPath = str(f'{fullOutputPath}/{shaderName}')
-        shortShaderSrcPath = f"./TANG{str(shaderPath).replace(projectDir, '')}"
-        shortShaderDstPath = f"./TANG{fullShaderDstPath.replace(projectDir, '')}"
-        print(f'[SHADER] Compiled "{os.path.normpath(shortShaderSrcPath)}" into "{os.path.normpath(shortShaderDstPath)}.spv"')
-    
+        shortShaderSrcPath = ConvertToRelativePath(shaderPath)
+        needsCompile = shaderPath in affectedFiles
+
+        # Call out shaders that are rebuilt purely because something they #include changed
+        if needsCompile and shaderPath not in dirtyFiles:
+            dependenciesRequiringRecompilation = [ ConvertToRelativePath(dependency) for dependency in ComputeDependencies(shaderPath) if dependency in dirtyFiles ]
+            dependenciesStr = "\n".join(f"{' ' * 21}{i + 1}) {dependency}" for (i, dependency) in enumerate(dependenciesRequiringRecompilation))
+            print(f'[SHADER] Edited dependencies for "{shortShaderSrcPath}":\n{dependenciesStr}')
+
+        # The .meta file only depends on the shader source itself, so it can be reused
+        # whenever the source hash is unchanged and the file on disk still matches the
+        # checksum we recorded for it (a partial write fails that test and regenerates)
+        needsMetadata = True
+        shaderOutput = GetShaderOutputPathFromSourcePath(shaderPath)
+        metaFilePath = f"{shaderOutput.path}/{shaderOutput.name}.meta"
+        shortMetaFilePath = ConvertToRelativePath(metaFilePath)
+
+        # Matching checksums prove nothing if the compiled byte code itself is gone
+        # (deleted output folder, etc.); one stat per shader keeps that honest
+        if not needsCompile and not os.path.isfile(f"{shaderOutput.path}/{shaderOutput.name}.spv"):
+            needsCompile = True
+        if shaderPath not in dirtyFiles and shortMetaFilePath in checksums:
+            try:
+                metaEntry = ComputeChecksumEntry(metaFilePath, checksums[shortMetaFilePath])
+                if metaEntry["h"] == GetStoredHash(checksums[shortMetaFilePath]):
+                    checksums[shortMetaFilePath] = metaEntry
+                    needsMetadata = False
+            except OSError:
+                pass
+
+        # Fully up-to-date shaders never reach the pool; spinning up a worker process
+        # just to report "skipped" would cost more than the stat-only gate saved
+        if not needsCompile and not needsMetadata:
+            print(f'[SHADER] Skipped "{shortShaderSrcPath}" (up-to-date)')
+            continue
+
+        workList.append((shaderPath, shortShaderSrcPath, needsCompile, needsMetadata))
+
+    # Compile shaders that share an include closure back-to-back. glslc re-parses every
+    # include per invocation and offers no way to feed it a pre-expanded prelude, so the
+    # best we can do is keep a group's shared includes hot in the OS file cache while
+    # all of its members go through the compiler
+    workList.sort(key=lambda workItem: (sorted(ComputeDependencies(workItem[0])), workItem[0]))
+
+    # Farm the per-shader work out to one worker per core. The glslc invocations are
+    # fully independent and CPU-bound, so this scales with the number of physical cores.
+    # The checksums are only updated back on the main process to avoid any races
+    allCompilesSucceeded = True
+    if workList:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for (shortShaderSrcPath, compileSucceeded, shortMetaFilePath, newMetaEntry, logMessages) in executor.map(CompileShader, workList):
+                if logMessages:
+                    print("\n".join(logMessages))
+                if newMetaEntry is not None:
+                    checksums[shortMetaFilePath] = newMetaEntry
+                if compileSucceeded:
+                    checksums[shortShaderSrcPath] = newHashes[shortShaderSrcPath]
+                else:
+                    allCompilesSucceeded = False
+
+    # Dependency hashes are shared between shaders, so only store them once every
+    # dependent shader compiled; otherwise the failed ones would not retry next run
+    if allCompilesSucceeded:
+        shaderShortPaths = { ConvertToRelativePath(shaderPath) for shaderPath in shaderList }
+        for (shortFilePath, newEntry) in newHashes.items():
+            if shortFilePath not in shaderShortPaths:
+                checksums[shortFilePath] = newEntry
+
+    # Write the checksums to a temporary file and swap it into place so a crash mid-write
+    # can never leave a torn checksum file behind (which would force spurious full
+    # rebuilds). Compact separators keep the file small and the encode cheap
+    temporaryChecksumFilePath = f"{checksumFilePath}.tmp"
+    with open(temporaryChecksumFilePath, "w") as checksumFile:
+        json.dump({ "version": G_CHECKSUM_VERSION, "files": checksums }, checksumFile, separators=(',', ':'))
+    os.replace(temporaryChecksumFilePath, checksumFilePath)
+
     print("Finished building shaders!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()